@@ -0,0 +1,102 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+"""
+Startup-time benchmark for the watchugo.py CLI.
+
+This measures how long `watchugo.py --help` takes, and how long it takes to import
+everything the vid-def subcommand needs. It also guards that neither of those imports
+any rendering dependencies, or creates any HTTP sessions. It exits with a nonzero
+status if a guard fails, or if a timing exceeds --max-secs.
+"""
+
+# Modules that only the render path should need.
+RENDER_MODULES = ["moviepy", "numpy", "PIL", "render", "render_util"]
+
+# Imports the same modules the vid-def subcommand does, and reports which
+# forbidden modules ended up loaded, and how many HTTP sessions were created.
+VID_DEF_GUARD = f"""
+import sys
+import watchugo
+args = watchugo.setup_argparser().parse_args(["vid-def", "--url", "https://en.wikipedia.org/wiki/List_of_x"])
+import vid_def, wiki_api, wiki_parse
+loaded = [m for m in {RENDER_MODULES!r} if m in sys.modules]
+print(",".join(loaded))
+print(wiki_api.create_session.cache_info().currsize)
+"""
+
+HELP_GUARD = f"""
+import sys
+import watchugo
+try:
+    watchugo.setup_argparser().parse_args(["--help"])
+except SystemExit:
+    pass
+loaded = [m for m in {RENDER_MODULES!r} + ["mwapi", "wikitextparser"] if m in sys.modules]
+print(",".join(loaded), file=sys.stderr)
+"""
+
+
+def time_command(command, n_runs: int) -> float:
+    """
+    Runs `command` n_runs times, and returns the median wall clock time in seconds.
+    """
+    times = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run_guard(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--max-secs",
+        type=float,
+        default=None,
+        help="Fail if the median startup time of either benchmark exceeds this.",
+    )
+    args = parser.parse_args()
+
+    failures = []
+
+    help_loaded = run_guard(HELP_GUARD).stderr.strip()
+    if help_loaded:
+        failures.append(f"--help imported {help_loaded}")
+
+    vid_def_loaded, n_sessions = run_guard(VID_DEF_GUARD).stdout.split("\n")[:2]
+    if vid_def_loaded:
+        failures.append(f"vid-def imported {vid_def_loaded}")
+    if int(n_sessions) != 0:
+        failures.append(f"importing vid-def created {n_sessions} HTTP session(s)")
+
+    timings = {
+        "watchugo.py --help": time_command(
+            [sys.executable, "watchugo.py", "--help"], args.runs
+        ),
+        "vid-def imports": time_command(
+            [sys.executable, "-c", "import watchugo, vid_def, wiki_api, wiki_parse"],
+            args.runs,
+        ),
+    }
+
+    for name, secs in timings.items():
+        print(f"{name}: {secs * 1000:.0f}ms (median of {args.runs})")
+        if args.max_secs is not None and secs > args.max_secs:
+            failures.append(f"{name} took {secs:.2f}s, over the {args.max_secs}s limit")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Union
+import hashlib
+import json
+import os
+
+import http_client
+import images
+import tts
+import vid_def
+
+"""
+Asset bundles let a video be rendered without any network access. A bundle is a
+directory holding the video definition, every segment image (already downloaded and
+downscaled), and all of the narration audio (already synthesized), plus a manifest
+with a SHA-256 hash of every file so a copied bundle can be checked before rendering.
+"""
+
+MANIFEST_FILE = "manifest.json"
+VIDEO_DEF_FILE = "video_def.json"
+BUNDLE_VERSION = 1
+
+# Images are downloaded a few at a time
+MAX_CONCURRENT_DOWNLOADS = 8
+
+
+@dataclass
+class Bundle:
+
+    # The directory the bundle is in.
+    path: str
+    # The video definition.
+    video_def: vid_def.VideoDef
+    # The narration audio files, relative to the bundle directory.
+    # These are in the order of vid_def.get_narration_texts.
+    narration: List[str]
+    # The segment image files, relative to the bundle directory, in segment order.
+    images: List[str]
+
+    def narration_paths(self) -> List[str]:
+        return [os.path.join(self.path, p) for p in self.narration]
+
+    def image_paths(self) -> List[str]:
+        return [os.path.join(self.path, p) for p in self.images]
+
+
+def hash_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(64 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def download_image(url: str, path: str):
+    with open(path, "wb") as f:
+        http_client.download(url, f)
+    images.prepare_image(path)
+
+
+def write_bundle(
+    video_def: vid_def.VideoDef,
+    path: str,
+    tts_backend: Union[tts.TTSBackend, None] = None,
+) -> Bundle:
+    """
+    Writes a bundle for video_def into the directory `path`, downloading every
+    image and synthesizing all narration.
+    """
+    if tts_backend is None:
+        tts_backend = tts.get_backend()
+
+    os.makedirs(os.path.join(path, "images"), exist_ok=True)
+    os.makedirs(os.path.join(path, "audio"), exist_ok=True)
+
+    bundle = Bundle(
+        path=path,
+        video_def=video_def,
+        narration=[
+            f"audio/{idx}.{tts_backend.file_extension}"
+            for idx in range(len(video_def.segments) + 2)
+        ],
+        images=[f"images/{idx + 1}.png" for idx in range(len(video_def.segments))],
+    )
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
+        # download images while we synthesize
+        downloads = executor.map(
+            download_image,
+            [segment.image_url for segment in video_def.segments],
+            bundle.image_paths(),
+        )
+        tts_backend.synthesize_batch(
+            vid_def.get_narration_texts(video_def), bundle.narration_paths()
+        )
+        # list() so that exceptions from the downloads are raised here
+        list(downloads)
+
+    vid_def.save_video_def(video_def, os.path.join(path, VIDEO_DEF_FILE))
+
+    hashes = {}
+    for file in [VIDEO_DEF_FILE, *bundle.narration, *bundle.images]:
+        hashes[file] = hash_file(os.path.join(path, file))
+
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "video_def": VIDEO_DEF_FILE,
+        "narration": bundle.narration,
+        "images": bundle.images,
+        "sha256": hashes,
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=True)
+
+    return bundle
+
+
+def is_bundle(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def load_bundle(path: str, verify: bool = True) -> Bundle:
+    """
+    Loads the bundle in the directory `path`. If verify is set, every file is checked
+    against its hash in the manifest, and a ValueError is raised on any mismatch.
+    """
+    with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+
+    if manifest["version"] != BUNDLE_VERSION:
+        raise ValueError(
+            f"Bundle {path} has version {manifest['version']}, but we only support version {BUNDLE_VERSION}."
+        )
+
+    if verify:
+        for file, expected_hash in manifest["sha256"].items():
+            if hash_file(os.path.join(path, file)) != expected_hash:
+                raise ValueError(f"{file} in bundle {path} does not match its hash.")
+
+    video_def = vid_def.load_video_def(os.path.join(path, manifest["video_def"]))
+
+    return Bundle(
+        path=path,
+        video_def=video_def,
+        narration=manifest["narration"],
+        images=manifest["images"],
+    )
@@ -0,0 +1,13 @@
+"""
+Default settings shared between the command line and the modules that use them.
+This module imports nothing, so the CLI can show these defaults without paying for
+importing the modules themselves.
+"""
+
+# The list qualification index (see list_index)
+DEFAULT_INDEX_PATH = "list_index.sqlite"
+# How many lists are scored into the index at once
+DEFAULT_FILL_WORKERS = 4
+
+# How often the worker checks its queue for new jobs
+DEFAULT_POLL_INTERVAL_SECS = 5
@@ -0,0 +1,121 @@
+from dataclasses import dataclass
+from typing import BinaryIO, List, Union
+import os
+import threading
+
+import requests
+import requests.adapters
+
+"""
+The HTTP client shared by everything that talks to Wikimedia. All requests go through
+a single requests.Session, which keeps a pool of keep-alive connections per host, so
+we only pay for a TCP and TLS handshake once per connection instead of once per request.
+
+Pool sizes and the download cap can be configured with environment variables.
+"""
+
+USER_AGENT = "WatchUGOBot/1.0 (kevin.trieu5813@gmail.com)"
+
+# The number of hosts to keep connection pools for.
+# We mostly talk to en.wikipedia.org, commons.wikimedia.org and upload.wikimedia.org.
+POOL_HOSTS = int(os.environ.get("WATCHUGO_HTTP_POOL_HOSTS", 4))
+# The number of connections to keep alive per host.
+POOL_SIZE = int(os.environ.get("WATCHUGO_HTTP_POOL_SIZE", 16))
+# Some Wikimedia originals are hundreds of megabytes. We refuse to download anything bigger than this.
+MAX_DOWNLOAD_BYTES = int(
+    os.environ.get("WATCHUGO_MAX_DOWNLOAD_BYTES", 50 * 1024 * 1024)
+)
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+TIMEOUT_SECS = 30
+
+session_lock = threading.Lock()
+session = None
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the shared session, creating it on first use.
+    """
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+            )
+        return session
+
+
+def download(url: str, fp: BinaryIO, max_bytes: Union[int, None] = None):
+    """
+    Streams the file at `url` into `fp`. If the file is bigger than `max_bytes`
+    (MAX_DOWNLOAD_BYTES by default), we stop and raise a RuntimeError.
+    """
+    if max_bytes is None:
+        max_bytes = MAX_DOWNLOAD_BYTES
+
+    with get_session().get(url, stream=True, timeout=TIMEOUT_SECS) as response:
+        response.raise_for_status()
+
+        # bail before downloading anything if the server tells us it's too big
+        content_length = response.headers.get("Content-Length")
+        if content_length is not None and int(content_length) > max_bytes:
+            raise RuntimeError(
+                f"{url} is {content_length} bytes, over the {max_bytes} byte limit."
+            )
+
+        n_bytes = 0
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+            n_bytes += len(chunk)
+            if n_bytes > max_bytes:
+                raise RuntimeError(f"{url} is over the {max_bytes} byte limit.")
+            fp.write(chunk)
+
+
+@dataclass
+class PoolMetrics:
+
+    # The scheme and host of the pool.
+    host: str
+    # The number of connections the pool has opened.
+    # If this is close to n_requests, connections aren't being reused.
+    n_connections: int
+    # The number of requests made through the pool.
+    n_requests: int
+
+
+def get_pool_metrics() -> List[PoolMetrics]:
+    """
+    Returns metrics for every connection pool the shared session currently holds.
+    """
+    metrics = []
+    for adapter in set(get_session().adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                # evicted while we were looking
+                continue
+            metrics.append(
+                PoolMetrics(
+                    host=f"{key.key_scheme}://{key.key_host}",
+                    n_connections=pool.num_connections,
+                    n_requests=pool.num_requests,
+                )
+            )
+    return metrics
+
+
+def format_pool_metrics() -> str:
+    lines = ["HTTP connection pools:"]
+    for m in get_pool_metrics():
+        lines.append(
+            f"  {m.host}: {m.n_requests} requests over {m.n_connections} connections"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,31 @@
+from typing import Tuple
+
+import PIL.Image
+import PIL.ImageFile
+
+# HACK: Tell PIL to just load slightly damaged images
+PIL.ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+# Images are displayed at most this big, in the 1080p video (see render.render_segment),
+# so there's no point keeping them any bigger.
+MAX_IMAGE_SIZE = (1920, 1080)
+
+
+def prepare_image(path: str, max_size: Tuple[int, int] = MAX_IMAGE_SIZE):
+    """
+    Prepares the downloaded image at `path` for rendering, overwriting it with a PNG.
+    We add a white background to images that don't have one, and downscale the image
+    to the smallest size that still covers `max_size`, since the blurred background
+    is scaled to fill the whole frame.
+    """
+    image = PIL.Image.open(path).convert("RGBA")
+
+    scale = max(max_size[0] / image.width, max_size[1] / image.height)
+    if scale < 1:
+        image = image.resize(
+            (round(image.width * scale), round(image.height * scale)),
+            PIL.Image.LANCZOS,
+        )
+
+    bg = PIL.Image.new("RGBA", image.size, (255, 255, 255, 255))
+    PIL.Image.alpha_composite(bg, image).save(path, format="png")
@@ -0,0 +1,239 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Union
+import random
+import sqlite3
+import threading
+import time
+
+import defaults
+import vid_def
+import wiki_api
+
+"""
+A persisted index of "List of" articles, scored with the same extraction heuristics
+we use to build videos. Random article selection can then sample only from lists
+that will actually produce a video, instead of fetching and parsing lists that turn
+out to be empty.
+"""
+
+# A list qualifies if it has enough eligible items...
+MIN_ELIGIBLE_ITEMS = 10
+# ...and enough of them have a page image. Items without one can still find a fallback
+# image on Commons, so we don't require all of them.
+MIN_IMAGE_FRACTION = 0.3
+
+# We estimate the image fraction from a sample of items, which is one bulk query.
+IMAGE_SAMPLE_SIZE = wiki_api.MAX_TITLES_PER_QUERY
+
+
+@dataclass
+class ListScore:
+    # The title of the list article.
+    title: str
+    # The number of unique items that point to existing articles.
+    n_eligible_items: int
+    # The fraction of sampled eligible items that have a page image.
+    image_fraction: float
+
+    def qualifies(self) -> bool:
+        return (
+            self.n_eligible_items >= MIN_ELIGIBLE_ITEMS
+            and self.image_fraction >= MIN_IMAGE_FRACTION
+        )
+
+
+def score_list_article(title: str, revision_id: Union[int, None] = None) -> ListScore:
+    """
+    Scores the list article `title`, using the same extraction and filtering
+    as vid_def.video_defs_from_list_url. If the article's latest revision_id is
+    known, we skip looking it up.
+    """
+    video_items = vid_def.get_viable_video_items(title, revision_id)
+
+    if len(video_items) == 0:
+        return ListScore(title=title, n_eligible_items=0, image_fraction=0.0)
+
+    sample = random.sample(video_items, min(IMAGE_SAMPLE_SIZE, len(video_items)))
+    sample_titles = [item.article_title for item in sample]
+    have_images = wiki_api.get_articles_have_images(sample_titles)
+    n_images = sum(have_images.get(t.lower(), False) for t in sample_titles)
+
+    return ListScore(
+        title=title,
+        n_eligible_items=len(video_items),
+        image_fraction=n_images / len(sample),
+    )
+
+
+class ListIndex:
+    """
+    The index is a single SQLite table. Every known list article has a row, and
+    rows are filled in with a score once the list has been scored.
+    """
+
+    def __init__(self, path: str = defaults.DEFAULT_INDEX_PATH):
+        # SQLite will wait this long for a background filler to finish writing
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lists (
+                title TEXT PRIMARY KEY,
+                n_eligible_items INTEGER,
+                image_fraction REAL,
+                scored_at REAL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def n_lists(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM lists").fetchone()[0]
+
+    def add_titles(self, titles: List[str]):
+        """
+        Adds unscored rows for any of `titles` not already in the index.
+        """
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO lists (title) VALUES (?)",
+            ((title,) for title in titles),
+        )
+        self.connection.commit()
+
+    def unscored_titles(self) -> List[str]:
+        rows = self.connection.execute(
+            "SELECT title FROM lists WHERE scored_at IS NULL"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def put_score(self, score: ListScore):
+        self.connection.execute(
+            """
+            INSERT OR REPLACE INTO lists (title, n_eligible_items, image_fraction, scored_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (score.title, score.n_eligible_items, score.image_fraction, time.time()),
+        )
+        self.connection.commit()
+
+    def get_score(self, title: str) -> Union[ListScore, None]:
+        row = self.connection.execute(
+            "SELECT n_eligible_items, image_fraction FROM lists WHERE title = ? AND scored_at IS NOT NULL",
+            (title,),
+        ).fetchone()
+        if row is None:
+            return None
+        return ListScore(title=title, n_eligible_items=row[0], image_fraction=row[1])
+
+    def n_qualifying(self) -> int:
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM lists WHERE n_eligible_items >= ? AND image_fraction >= ?",
+            (MIN_ELIGIBLE_ITEMS, MIN_IMAGE_FRACTION),
+        ).fetchone()[0]
+
+    def random_qualifying_title(self) -> Union[str, None]:
+        """
+        Returns a random list article that qualifies, or None if there aren't any.
+        """
+        row = self.connection.execute(
+            "SELECT title FROM lists WHERE n_eligible_items >= ? AND image_fraction >= ? ORDER BY RANDOM() LIMIT 1",
+            (MIN_ELIGIBLE_ITEMS, MIN_IMAGE_FRACTION),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+
+def refresh_catalog(index: ListIndex):
+    """
+    Adds every "List of" article on Wikipedia to the index. This is a few hundred
+    requests, so it prints progress as it goes.
+    """
+
+    def progress(n_articles_seen: int):
+        print(f"Cataloguing list articles... ({n_articles_seen} seen)")
+
+    index.add_titles(list(wiki_api.iterate_list_articles(progress)))
+
+
+def safe_score_list_article(
+    title: str, revision_id: Union[int, None] = None
+) -> Union[ListScore, None]:
+    """
+    Scores a list article, returning None if that failed. Failures are often temporary
+    (timeouts, rate limits), so they're left unscored to be retried on a later fill.
+    """
+    try:
+        return score_list_article(title, revision_id)
+    except Exception as e:
+        print(f"Failed to score {title}: {e}")
+        return None
+
+
+def safe_get_latest_revision_ids(titles: List[str]) -> List[Union[int, None]]:
+    """
+    Looks up the latest revision of each title in bulk, so that lists we've already
+    extracted at that revision are scored from the cache. If the lookup fails, every
+    revision is None, and each list looks up its own revision while it's scored.
+    """
+    try:
+        revision_ids = wiki_api.get_latest_revision_ids(titles)
+    except Exception as e:
+        print(f"Failed to look up revisions: {e}")
+        revision_ids = {}
+    return [revision_ids.get(t.lower(), None) for t in titles]
+
+
+def fill_index(
+    index: ListIndex,
+    limit: Union[int, None] = None,
+    workers: int = defaults.DEFAULT_FILL_WORKERS,
+    progress_lambda: Callable[[ListScore], None] = None,
+):
+    """
+    Scores up to `limit` randomly chosen unscored lists in the index (or all of them,
+    if limit is None), using `workers` concurrent scorers.
+    """
+    titles = index.unscored_titles()
+    random.shuffle(titles)
+    if limit is not None:
+        titles = titles[:limit]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Score a chunk at a time, so that scoring starts after one revision lookup,
+        # instead of after looking up every title.
+        for chunk in wiki_api.split_every(wiki_api.MAX_TITLES_PER_QUERY, titles):
+            chunk_revision_ids = safe_get_latest_revision_ids(chunk)
+            for score in executor.map(
+                safe_score_list_article, chunk, chunk_revision_ids
+            ):
+                if score is None:
+                    continue
+                # Only this thread writes to the index, since SQLite connections
+                # can't be shared.
+                index.put_score(score)
+                if progress_lambda:
+                    progress_lambda(score)
+
+
+def fill_index_in_background(
+    index_path: str, limit: int, workers: int = defaults.DEFAULT_FILL_WORKERS
+) -> threading.Thread:
+    """
+    Starts a daemon thread that scores up to `limit` unscored lists in the index at `index_path`.
+    The thread opens its own connection to the index.
+    """
+
+    def fill():
+        index = ListIndex(index_path)
+        try:
+            fill_index(index, limit, workers)
+        finally:
+            index.close()
+
+    thread = threading.Thread(target=fill, daemon=True)
+    thread.start()
+    return thread
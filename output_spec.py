@@ -0,0 +1,45 @@
+from dataclasses import dataclass
+from typing import Tuple, Union
+
+"""
+Describes the outputs a rendered video is encoded to (see render.save_files).
+This module imports nothing heavy, so command line arguments can be parsed into
+output specs without importing the renderer.
+"""
+
+
+@dataclass
+class OutputSpec:
+
+    # Where to save the video.
+    path: str
+    # The (width, height) to encode at. If None, we keep the composited size.
+    size: Union[Tuple[int, int], None] = None
+    # The video bitrate, in ffmpeg format (e.g. "8000k"). If None, ffmpeg picks one.
+    bitrate: Union[str, None] = None
+
+
+def parse_output_spec(spec: str) -> OutputSpec:
+    """
+    Parses an output spec of the form [WIDTHxHEIGHT]:[BITRATE]:PATH, e.g.
+    "1280x720:4000k:out_720.mp4". The size and bitrate can be left empty,
+    e.g. "::out.mp4". Raises a ValueError if the spec is malformed.
+    """
+    parts = spec.split(":", 2)
+    if len(parts) != 3 or parts[2] == "":
+        raise ValueError(
+            f"Output spec {spec} must have the format [WIDTHxHEIGHT]:[BITRATE]:PATH."
+        )
+    size_str, bitrate, path = parts
+
+    size = None
+    if size_str != "":
+        try:
+            width, height = size_str.lower().split("x")
+            size = (int(width), int(height))
+        except ValueError:
+            raise ValueError(
+                f"Output size {size_str} must have the format WIDTHxHEIGHT."
+            )
+
+    return OutputSpec(path=path, size=size, bitrate=bitrate or None)
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+import queue
+import threading
+
+import moviepy.editor as mpy
+
+import render
+import render_util
+import tts
+import vid_def
+import wiki_parse
+
+"""
+A pipelined version of vid-def followed by render, used by the full command.
+
+Instead of fetching every segment's metadata, then synthesizing all the narration and
+downloading all the images, then compositing, each stage passes segments on as soon as
+they're ready:
+
+    metadata (in order) -> narration + image download (concurrently) -> compositing
+
+Stages are connected by bounded queues, so a fast stage can't run too far ahead of a
+slow one. Segments are accepted in exactly the same order as vid_def.build_segments,
+so the resulting video definition is identical.
+"""
+
+# How many segments can be waiting between stages
+QUEUE_SIZE = 4
+# How many segments can have their narration and image fetched at once
+ASSET_WORKERS = 4
+
+
+def fetch_segment_assets(
+    num: int, segment: vid_def.Segment, tts_backend: tts.TTSBackend
+) -> Tuple[mpy.AudioClip, mpy.ImageClip]:
+    text = vid_def.generate_segment_tts_text(num, segment)
+    return (
+        render_util.tts_speak(text, tts_backend),
+        render_util.image_download(segment.image_url),
+    )
+
+
+def run_metadata_stage(
+    video_items: List[wiki_parse.VideoItem],
+    segments: List[vid_def.Segment],
+    out_queue: queue.Queue,
+    errors: List,
+):
+    """
+    Builds segments in order, appending each to `segments`, and passing it on.
+    Always ends by passing on None.
+    """
+    try:
+        for segment in vid_def.iterate_segments(
+            video_items, vid_def.SEGMENTS_PER_VIDEO
+        ):
+            segments.append(segment)
+            out_queue.put((len(segments), segment))
+    except Exception as e:
+        errors.append(e)
+    finally:
+        out_queue.put(None)
+
+
+def run_compositing_stage(
+    in_queue: queue.Queue, segment_clips: Dict[int, mpy.VideoClip], errors: List
+):
+    """
+    Composites each segment once its assets are ready, until we get None.
+    If anything fails, we record the error and keep draining the queue,
+    so that the earlier stages don't block on us.
+    """
+    while True:
+        entry = in_queue.get()
+        if entry is None:
+            return
+        if len(errors) > 0:
+            continue
+
+        num, segment, assets = entry
+        try:
+            audio_clip, image_clip = assets.result()
+            segment_clips[num] = render.render_segment(
+                num, segment, audio_clip, image_clip
+            )
+        except Exception as e:
+            errors.append(e)
+
+
+def build_and_render(
+    url: str, tts_backend: Union[tts.TTSBackend, None] = None
+) -> Tuple[vid_def.VideoDef, Union[mpy.VideoClip, None]]:
+    """
+    Builds a video definition from a list article and renders it, overlapping
+    the network-bound and CPU-bound work. Returns the video definition, and the
+    rendered clip, or None if the list had no usable segments.
+    """
+    if tts_backend is None:
+        tts_backend = tts.get_backend()
+
+    article_title = wiki_parse.get_article_title_from_url(url)
+    video_items = vid_def.get_viable_video_items(article_title)
+
+    segments = []
+    segment_clips = {}
+    errors = []
+    metadata_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    compositing_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    with ThreadPoolExecutor(max_workers=ASSET_WORKERS) as asset_executor:
+        # the outro doesn't depend on anything, so start on it right away
+        outro_audio = asset_executor.submit(
+            render_util.tts_speak, vid_def.OUTRO_TEXT, tts_backend, shared=True
+        )
+
+        metadata_thread = threading.Thread(
+            target=run_metadata_stage,
+            args=(video_items, segments, metadata_queue, errors),
+        )
+        compositing_thread = threading.Thread(
+            target=run_compositing_stage,
+            args=(compositing_queue, segment_clips, errors),
+        )
+        metadata_thread.start()
+        compositing_thread.start()
+
+        # Hand each segment's assets to the executor as soon as its metadata is in.
+        # Because the compositing queue is bounded, only a few are in flight at once.
+        while True:
+            entry = metadata_queue.get()
+            if entry is None:
+                break
+            num, segment = entry
+            assets = asset_executor.submit(
+                fetch_segment_assets, num, segment, tts_backend
+            )
+            compositing_queue.put((num, segment, assets))
+
+        compositing_queue.put(None)
+        metadata_thread.join()
+        compositing_thread.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    video_def = vid_def.video_def_from_segments(article_title, url, segments)
+    if len(segments) == 0:
+        return video_def, None
+
+    # The intro needs the title, which needs the final number of segments,
+    # so it has to come last.
+    intro_audio = render_util.tts_speak(
+        vid_def.generate_intro_tts_text(video_def.title), tts_backend
+    )
+    intro_clip = render.render_intro_clip(video_def, intro_audio)
+    outro_clip = render.render_outro_clip(outro_audio.result())
+
+    clip = render.assemble_video(
+        intro_clip,
+        [segment_clips[num] for num in range(1, len(segments) + 1)],
+        outro_clip,
+    )
+    return video_def, clip
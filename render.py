@@ -3,9 +3,18 @@ import moviepy.video.fx.all as vfx
 import numpy as np
 import PIL.ImageFilter
 import PIL.Image
-import jsonpickle
 from moviepy.video.compositing.concatenate import concatenate_videoclips
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from typing import List, Tuple, Union
+import functools
+import os
+import queue
+import threading
+import bundle
+import output_spec
 import render_util
+import temp
+import tts
 
 import vid_def
 
@@ -35,22 +44,47 @@ OUTRO_SLATE_WAIT_SECS = 0.5
 SEGMENT_WAIT_SECS = 0.5
 
 
-def load_video_def_from_file(file_path: str) -> vid_def.VideoDef:
-    with open(file_path, "r") as f:
-        return jsonpickle.decode(f.read())
-
-
-# We need that space between U and GO, or Google will read it wrong.
-INTRO_TEXT = "Welcome back to Watch U GO. Today, we're looking at the"
+@functools.lru_cache(maxsize=None)
+def load_static_image(path: str) -> mpy.ImageClip:
+    """
+    Loads one of our static images. These are the same for every video,
+    so we only decode them once per process.
+    """
+    return mpy.ImageClip(path)
+
+
+def load_render_input(
+    path: str,
+) -> Tuple[vid_def.VideoDef, Union[bundle.Bundle, None]]:
+    """
+    Loads either a video definition file, or an asset bundle directory.
+    Returns the video definition, and the bundle if there was one.
+    """
+    if bundle.is_bundle(path):
+        video_bundle = bundle.load_bundle(path)
+        return video_bundle.video_def, video_bundle
+    else:
+        return vid_def.load_video_def(path), None
 
 
-def generate_intro_tts_text(video_title: str) -> str:
-    return f"{INTRO_TEXT} {video_title}"
+def freeze_frame(clip: mpy.VideoClip) -> mpy.VideoClip:
+    """
+    Every layer of our slates and segments is a still image, so every frame of them
+    is identical. We composite the first frame once, and show it for the whole clip,
+    instead of compositing (and blurring) every frame again while encoding.
+    """
+    return (
+        mpy.ImageClip(clip.get_frame(0))
+        .set_duration(clip.duration)
+        .set_fps(clip.fps)
+        .set_audio(clip.audio)
+    )
 
 
-def render_intro_clip(video_def: vid_def.VideoDef) -> mpy.VideoClip:
-    intro_audio = render_util.tts_speak(generate_intro_tts_text(video_def.title))
-    intro_img = mpy.ImageClip(INTRO_SLATE_LOCATION)
+def render_intro_clip(
+    video_def: vid_def.VideoDef, intro_audio: mpy.AudioClip
+) -> mpy.VideoClip:
+    intro_img = load_static_image(INTRO_SLATE_LOCATION)
 
     intro_text = mpy.TextClip(
         txt=video_def.title, size=INTRO_SLATE_TEXT_SIZE, font=FONT_PATH, color="black"
@@ -63,16 +97,11 @@ def render_intro_clip(video_def: vid_def.VideoDef) -> mpy.VideoClip:
         .set_audio(intro_audio)
     )
 
-    return intro_clip
+    return freeze_frame(intro_clip)
 
 
-OUTRO_TEXT = "Thanks for watching! Please remember to like, favorite, and subscribe!"
-
-
-def render_outro_clip() -> mpy.VideoClip:
-
-    outro_audio = render_util.tts_speak(OUTRO_TEXT)
-    outro_img = mpy.ImageClip(OUTRO_SLATE_LOCATION)
+def render_outro_clip(outro_audio: mpy.AudioClip) -> mpy.VideoClip:
+    outro_img = load_static_image(OUTRO_SLATE_LOCATION)
 
     outro_clip = (
         outro_img.set_duration(outro_audio.duration + OUTRO_SLATE_WAIT_SECS)
@@ -83,11 +112,6 @@ def render_outro_clip() -> mpy.VideoClip:
     return outro_clip
 
 
-def get_segment_tts(num: int, segment: vid_def.Segment) -> mpy.AudioClip:
-    text = f"Number {num}: {segment.name}. {segment.description}"
-    return render_util.tts_speak(text)
-
-
 def blur_filter(frame):
     pil_image = PIL.Image.fromarray(frame)
     pil_image = pil_image.filter(PIL.ImageFilter.GaussianBlur(radius=50))
@@ -96,11 +120,13 @@ def blur_filter(frame):
     return blurred
 
 
-def render_segment(num: int, segment: vid_def.Segment) -> mpy.VideoClip:
-    audio_clip = get_segment_tts(num, segment)
-    image_clip = render_util.image_download(segment.image_url)
-
-    text_overlay_clip = mpy.ImageClip(OVERLAY_LOCATION)
+def render_segment(
+    num: int,
+    segment: vid_def.Segment,
+    audio_clip: mpy.AudioClip,
+    image_clip: mpy.ImageClip,
+) -> mpy.VideoClip:
+    text_overlay_clip = load_static_image(OVERLAY_LOCATION)
     name_text = mpy.TextClip(
         txt=segment.name, size=SEGMENT_NAME_SIZE, font=FONT_PATH, color="white"
     ).set_position(SEGMENT_NAME_ORIGIN)
@@ -127,7 +153,7 @@ def render_segment(num: int, segment: vid_def.Segment) -> mpy.VideoClip:
         y_center=image_blurred.h / 2,
     ).fl_image(blur_filter)
 
-    return (
+    segment_clip = (
         mpy.CompositeVideoClip(
             [image_blurred, image_clip, text_overlay_clip, name_text, number_text],
             size=(VIDEO_WIDTH, VIDEO_HEIGHT),
@@ -137,23 +163,175 @@ def render_segment(num: int, segment: vid_def.Segment) -> mpy.VideoClip:
         .set_audio(audio_clip)
     )
 
+    return freeze_frame(segment_clip)
+
+
+def render_video_def(
+    video_def: vid_def.VideoDef,
+    tts_backend: Union[tts.TTSBackend, None] = None,
+    video_bundle: Union[bundle.Bundle, None] = None,
+) -> mpy.VideoClip:
+    """
+    Renders video_def. If an asset bundle is given, its images and narration are used,
+    and nothing is fetched over the network.
+    """
+    if video_bundle is not None:
+        narration = [mpy.AudioFileClip(p) for p in video_bundle.narration_paths()]
+        image_clips = [mpy.ImageClip(p) for p in video_bundle.image_paths()]
+    else:
+        # Speak all the narration in one batch before compositing anything
+        narration = render_util.tts_speak_all(
+            vid_def.get_narration_texts(video_def),
+            tts_backend,
+            shared_texts=[vid_def.OUTRO_TEXT],
+        )
+        image_clips = [
+            render_util.image_download(segment.image_url)
+            for segment in video_def.segments
+        ]
+
+    intro_audio, *segment_audio, outro_audio = narration
 
-def render_video_def(video_def: vid_def.VideoDef) -> mpy.VideoClip:
-    intro_clip = render_intro_clip(video_def)
+    intro_clip = render_intro_clip(video_def, intro_audio)
 
     segment_clips = []
     for idx, segment in enumerate(video_def.segments):
-        segment_clip = render_segment(idx + 1, segment)
+        segment_clip = render_segment(
+            idx + 1, segment, segment_audio[idx], image_clips[idx]
+        )
         segment_clips.append(segment_clip)
 
-    outro_clip = render_outro_clip()
-
-    final_video = concatenate_videoclips(
-        [intro_clip, *reversed(segment_clips), outro_clip]
-    )
-
-    return final_video
+    outro_clip = render_outro_clip(outro_audio)
+
+    return assemble_video(intro_clip, segment_clips, outro_clip)
+
+
+def assemble_video(
+    intro_clip: mpy.VideoClip,
+    segment_clips: List[mpy.VideoClip],
+    outro_clip: mpy.VideoClip,
+) -> mpy.VideoClip:
+    """
+    Puts the final video together. segment_clips are in order of their number,
+    and we count down, so they're played in reverse.
+    """
+    return concatenate_videoclips([intro_clip, *reversed(segment_clips), outro_clip])
+
+
+# The total number of encoder threads, split between all outputs
+ENCODER_THREADS = 8
+# How many frames each encoder can fall behind before compositing waits for it
+ENCODER_QUEUE_FRAMES = 48
+AUDIO_FPS = 44100
+
+
+def run_encoder(writer: FFMPEG_VideoWriter, frames: queue.Queue, errors: List):
+    """
+    Feeds frames from the queue into the writer, until we get None.
+    If the encoder fails, we record the error and keep draining the queue,
+    so that compositing doesn't block on us.
+    """
+    while True:
+        frame = frames.get()
+        if frame is None:
+            return
+        if len(errors) == 0:
+            try:
+                writer.write_frame(frame)
+            except Exception as e:
+                errors.append(e)
+
+
+def close_writers(writers: List[FFMPEG_VideoWriter]):
+    """
+    Closes every writer after a failure. A failed ffmpeg may have closed its end of the
+    pipe already, so errors while closing are ignored.
+    """
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+def remove_outputs(outputs: List[output_spec.OutputSpec]):
+    """
+    Removes any partially written outputs.
+    """
+    for output in outputs:
+        try:
+            os.remove(output.path)
+        except FileNotFoundError:
+            pass
+
+
+def save_files(outputs: List[output_spec.OutputSpec], clip: mpy.VideoClip):
+    """
+    Saves the clip to every output. Each frame is composited once, and fanned out
+    to a separate ffmpeg encoder per output, which does its own scaling.
+    The audio is also only encoded once, and copied into every output.
+    If any output fails, we stop, and none of the outputs are kept.
+    """
+    with temp.get_temp_file(suffix=".mp3") as audio_file:
+        pass
+    clip.audio.write_audiofile(audio_file.name, fps=AUDIO_FPS, codec="libmp3lame")
+
+    threads = max(1, ENCODER_THREADS // len(outputs))
+    writers = []
+    try:
+        for output in outputs:
+            ffmpeg_params = None
+            if output.size is not None:
+                ffmpeg_params = ["-vf", f"scale={output.size[0]}:{output.size[1]}"]
+            writers.append(
+                FFMPEG_VideoWriter(
+                    output.path,
+                    clip.size,
+                    clip.fps,
+                    audiofile=audio_file.name,
+                    bitrate=output.bitrate,
+                    threads=threads,
+                    ffmpeg_params=ffmpeg_params,
+                )
+            )
+    except Exception:
+        close_writers(writers)
+        remove_outputs(outputs)
+        raise
+
+    queues = [queue.Queue(maxsize=ENCODER_QUEUE_FRAMES) for _ in writers]
+    errors = []
+    encoder_threads = [
+        threading.Thread(target=run_encoder, args=(writer, frames, errors))
+        for writer, frames in zip(writers, queues)
+    ]
+    for thread in encoder_threads:
+        thread.start()
+
+    composited = False
+    try:
+        for frame in clip.iter_frames(fps=clip.fps, dtype="uint8", logger="bar"):
+            if len(errors) > 0:
+                # an encoder failed, so there's no point compositing any more frames
+                break
+            for frames in queues:
+                frames.put(frame)
+        composited = True
+    finally:
+        for frames in queues:
+            frames.put(None)
+        for thread in encoder_threads:
+            thread.join()
+        if composited and len(errors) == 0:
+            for writer in writers:
+                writer.close()
+        else:
+            close_writers(writers)
+            remove_outputs(outputs)
+
+    if len(errors) > 0:
+        raise errors[0]
 
 
 def save_file(path: str, clip: mpy.VideoClip):
-    clip.write_videofile(path, threads=8)
+    save_files([output_spec.OutputSpec(path=path)], clip)
@@ -1,27 +1,65 @@
-import tempfile
-from wiki_api import USER_AGENT
-import gtts
+from typing import Collection, Dict, List, Tuple, Union
+import threading
 import moviepy.editor as mpy
-import requests
-import PIL.ImageFile
-import PIL.Image
 
+import http_client
+import images
 import temp
+import tts
 
-# HACK: Tell PIL to just load slightly damaged images
-PIL.ImageFile.LOAD_TRUNCATED_IMAGES = True
+# Some narration (like the outro) is the same for every video, so we keep
+# the synthesized audio around for the life of the process.
+# Keyed by the backend name and the text. Only texts the caller marks as shared
+# are cached, so a long-running worker doesn't keep every video's narration forever.
+tts_cache: Dict[Tuple[str, str], str] = {}
+tts_cache_lock = threading.Lock()
 
 
-def tts_speak(text: str) -> mpy.AudioFileClip:
+def tts_speak_all(
+    texts: List[str],
+    backend: Union[tts.TTSBackend, None] = None,
+    shared_texts: Collection[str] = (),
+) -> List[mpy.AudioFileClip]:
     """
-    Uses Google TTS to speak `text`, and then converts that sound
-    into a MoviePy AudioFileClip.
+    Speaks every string in `texts` in one batch with the given TTS backend,
+    and converts each sound into a MoviePy AudioFileClip.
+    Strings in `shared_texts` are only synthesized once per process.
     """
-    tts = gtts.gTTS(text)
-    with temp.get_temp_file() as temp_file:
-        tts.write_to_fp(temp_file)
-    clip = mpy.AudioFileClip(temp_file.name)
-    return clip
+    if backend is None:
+        backend = tts.get_backend()
+
+    backend_name = type(backend).__name__
+    with tts_cache_lock:
+        missing = [t for t in set(texts) if (backend_name, t) not in tts_cache]
+
+    paths = {}
+    for text in missing:
+        with temp.get_temp_file(keep=text in shared_texts) as temp_file:
+            paths[text] = temp_file.name
+
+    if len(missing) > 0:
+        backend.synthesize_batch(missing, [paths[t] for t in missing])
+
+    with tts_cache_lock:
+        for text in missing:
+            if text in shared_texts:
+                tts_cache[(backend_name, text)] = paths[text]
+        for text in texts:
+            if text not in paths:
+                paths[text] = tts_cache[(backend_name, text)]
+
+    return [mpy.AudioFileClip(paths[t]) for t in texts]
+
+
+def tts_speak(
+    text: str, backend: Union[tts.TTSBackend, None] = None, shared: bool = False
+) -> mpy.AudioFileClip:
+    """
+    Speaks `text`, and then converts that sound into a MoviePy AudioFileClip.
+    If `shared` is set, the audio is cached for the life of the process.
+    """
+    shared_texts = [text] if shared else []
+    return tts_speak_all([text], backend, shared_texts)[0]
 
 
 def image_download(url: str):
@@ -29,16 +67,8 @@ def image_download(url: str):
     Downloads the image at URL and saves it into a
     ImageClip.
     """
-    response = requests.get(url, headers={"User-Agent": USER_AGENT})
-
     with temp.get_temp_file() as temp_file:
-        temp_file.write(response.content)
-
-    # add a background to images that don't have one
-    image = PIL.Image.open(temp_file.name).convert("RGBA")
-    bg = PIL.Image.new("RGBA", image.size, (255, 255, 255, 255))
-    with_background = PIL.Image.alpha_composite(bg, image).save(
-        temp_file.name, format="png"
-    )
+        http_client.download(url, temp_file)
 
+    images.prepare_image(temp_file.name)
     return mpy.ImageClip(temp_file.name)
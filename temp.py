@@ -1,19 +1,61 @@
+from typing import List
 import tempfile
 import os
 import atexit
+import threading
 
 """
 Since moviepy needs the audio files to exist for the duration of the program,
 this module wraps the tempfile module, keeps the files open,
 and then deletes them all on exit.
+
+Long-running processes can instead collect the temp files made for one piece of
+work in a TempFileScope, and delete them as soon as that work is done.
 """
 
 tempfiles = []
 
+# The scope that temp files made by the current thread belong to, if any
+local = threading.local()
+
+
+class TempFileScope:
+    """
+    While a scope is entered, temp files made by the entering thread are recorded in it,
+    instead of being kept until exit. Call remove_all once nothing uses them anymore.
+    """
+
+    def __init__(self):
+        self.paths: List[str] = []
+
+    def __enter__(self):
+        self.previous = getattr(local, "scope", None)
+        local.scope = self
+        return self
+
+    def __exit__(self, *exc_info):
+        local.scope = self.previous
+
+    def remove_all(self):
+        for f in self.paths:
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+        self.paths = []
+
 
-def get_temp_file():
-    temp = tempfile.NamedTemporaryFile(delete=False)
-    tempfiles.append(temp.name)
+def get_temp_file(suffix: str = "", keep: bool = False):
+    """
+    Makes a temp file. If `keep` is set, the file is kept until exit even inside a
+    TempFileScope, e.g. because it's cached for later work.
+    """
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    scope = getattr(local, "scope", None)
+    if scope is not None and not keep:
+        scope.paths.append(temp.name)
+    else:
+        tempfiles.append(temp.name)
     return temp
 
 
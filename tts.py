@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
+import os
+import threading
+
+"""
+Text-to-speech backends. Each backend knows how to write spoken audio for a piece
+of text to a file, and how to do that for a whole batch of texts at once.
+The backend is selected by name, either explicitly or through the
+WATCHUGO_TTS_BACKEND environment variable.
+"""
+
+# Google TTS is a network round trip per string, so we run a few at once.
+MAX_CONCURRENT_REQUESTS = 8
+
+
+class TTSBackend:
+
+    # The extension of the audio files this backend writes.
+    file_extension = "audio"
+
+    def synthesize(self, text: str, path: str):
+        """
+        Speak `text`, and write the resulting audio to `path`.
+        """
+        raise NotImplementedError()
+
+    def synthesize_batch(self, texts: List[str], paths: List[str]):
+        """
+        Speak every string in `texts`, writing each one to the matching entry in `paths`.
+        By default, we just call synthesize concurrently.
+        """
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            # list() so that exceptions from the workers are raised here
+            list(executor.map(self.synthesize, texts, paths))
+
+
+class GoogleTTSBackend(TTSBackend):
+    """
+    Uses Google TTS. Requires network access.
+    """
+
+    file_extension = "mp3"
+
+    def synthesize(self, text: str, path: str):
+        # imported here so that just selecting a backend stays cheap
+        import gtts
+
+        tts = gtts.gTTS(text)
+        tts.save(path)
+
+
+class OfflineTTSBackend(TTSBackend):
+    """
+    Uses the local speech engine through pyttsx3 (eSpeak on Linux). Works without
+    network access, but pyttsx3 must be installed.
+    """
+
+    file_extension = "wav"
+
+    def __init__(self):
+        try:
+            import pyttsx3
+        except ImportError:
+            raise RuntimeError(
+                "The offline TTS backend requires pyttsx3. Install it with `pipenv install pyttsx3`."
+            )
+        self.engine = pyttsx3.init()
+        self.lock = threading.Lock()
+
+    def synthesize(self, text: str, path: str):
+        self.synthesize_batch([text], [path])
+
+    def synthesize_batch(self, texts: List[str], paths: List[str]):
+        # The engine isn't thread-safe, but it can queue up every string and
+        # write them all out in one run.
+        with self.lock:
+            for text, path in zip(texts, paths):
+                self.engine.save_to_file(text, path)
+            self.engine.runAndWait()
+
+
+BACKENDS = {
+    "google": GoogleTTSBackend,
+    "offline": OfflineTTSBackend,
+}
+
+DEFAULT_BACKEND = "google"
+
+
+def get_backend(name: Union[str, None] = None) -> TTSBackend:
+    """
+    Create the TTS backend named `name`. If no name is given, we use the
+    WATCHUGO_TTS_BACKEND environment variable, falling back to Google TTS.
+    """
+    if name is None:
+        name = os.environ.get("WATCHUGO_TTS_BACKEND", DEFAULT_BACKEND)
+
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown TTS backend {name}. Valid backends are: {', '.join(BACKENDS)}."
+        )
+
+    return BACKENDS[name]()
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import List, Union
+from typing import Iterator, List, Union
+import os
 import random
 
 import jsonpickle
@@ -86,34 +87,137 @@ def build_description(
     return description
 
 
-def video_def_from_list_url(url: str) -> VideoDef:
-    article_title = wiki_parse.get_article_title_from_url(url)
-    parsed = wiki_parse.parse_article_wikitext(article_title)
-    video_items = wiki_parse.extract_video_items(parsed)
+# The number of segments in a video
+SEGMENTS_PER_VIDEO = 10
+
+# The number of candidate items we fetch segment metadata for at once
+SEGMENT_BATCH_SIZE = wiki_api.MAX_EXTRACTS_PER_QUERY
+
+
+def get_viable_video_items(
+    article_title: str, revision_id: Union[int, None] = None
+) -> List[wiki_parse.VideoItem]:
+    """
+    Returns the unique items in the list article that point to existing articles,
+    in random order. The revision_id is passed to wiki_parse.get_article_video_items.
+    """
+    video_items = wiki_parse.get_article_video_items(article_title, revision_id)
     video_items = filter_nonexistent_video_items(video_items)
     video_items = remove_duplicate_video_items(video_items)
-
-    # some items may fail after fetching, in which case they return None.
-    # So, we iterate through the items randomly, building at most 10.
     random.shuffle(video_items)
-    segments = []
+    return video_items
+
+
+def iterate_segments(
+    video_items: List[wiki_parse.VideoItem], n_segments: int
+) -> Iterator[Segment]:
+    """
+    Builds at most n_segments segments from video_items, in order, yielding each
+    one as soon as it's built.
+    Some items may fail after fetching, in which case they're skipped.
+    """
+    n_built = 0
+    next_item = 0
 
-    for item in video_items:
-        segment = wiki_parse.segment_from_video_item(item)
-        if segment is not None:
-            segments.append(segment)
-        if len(segments) == 10:
-            break
+    while n_built < n_segments and next_item < len(video_items):
+        # don't fetch more than we could possibly need
+        batch_size = min(SEGMENT_BATCH_SIZE, n_segments - n_built)
+        batch = video_items[next_item : next_item + batch_size]
+        next_item += batch_size
 
+        for segment in wiki_parse.segments_from_video_items(batch):
+            if segment is not None:
+                n_built += 1
+                yield segment
+
+
+def build_segments(
+    video_items: List[wiki_parse.VideoItem], n_segments: int
+) -> List[Segment]:
+    return list(iterate_segments(video_items, n_segments))
+
+
+def video_def_from_segments(
+    article_title: str,
+    url: str,
+    segments: List[Segment],
+    part: Union[int, None] = None,
+) -> VideoDef:
+    """
+    Builds the video definition for a list of segments. If the video is one part
+    of a series, part is its (one-based) number.
+    """
     video_title = video_title_from_article_title(article_title, len(segments))
+    if part is not None:
+        video_title += f" (Part {part})"
     description = build_description(video_title, segments, url)
     return VideoDef(title=video_title, description=description, segments=segments)
 
 
+def video_defs_from_list_url(url: str, n_videos: int) -> List[VideoDef]:
+    """
+    Builds up to n_videos videos from one list article, without reusing any items.
+    The article is only fetched and parsed once. Every video but the last has
+    SEGMENTS_PER_VIDEO segments; we stop early if the list runs out of items.
+    At least one (possibly empty) video is always returned.
+    """
+    if n_videos < 1:
+        raise ValueError(f"Can't build {n_videos} videos; n_videos must be at least 1.")
+
+    article_title = wiki_parse.get_article_title_from_url(url)
+    video_items = get_viable_video_items(article_title)
+    segments = build_segments(video_items, n_videos * SEGMENTS_PER_VIDEO)
+
+    video_defs = []
+    for start in range(0, max(len(segments), 1), SEGMENTS_PER_VIDEO):
+        video_segments = segments[start : start + SEGMENTS_PER_VIDEO]
+        part = len(video_defs) + 1 if n_videos > 1 else None
+        video_defs.append(
+            video_def_from_segments(article_title, url, video_segments, part)
+        )
+
+    return video_defs
+
+
+def video_def_from_list_url(url: str) -> VideoDef:
+    return video_defs_from_list_url(url, 1)[0]
+
+
+# We need that space between U and GO, or Google will read it wrong.
+INTRO_TEXT = "Welcome back to Watch U GO. Today, we're looking at the"
+
+OUTRO_TEXT = "Thanks for watching! Please remember to like, favorite, and subscribe!"
+
+
+def generate_intro_tts_text(video_title: str) -> str:
+    return f"{INTRO_TEXT} {video_title}"
+
+
+def generate_segment_tts_text(num: int, segment: Segment) -> str:
+    return f"Number {num}: {segment.name}. {segment.description}"
+
+
+def get_narration_texts(video_def: VideoDef) -> List[str]:
+    """
+    Returns every string we need to speak for a video, in the order
+    intro, segments (by number), outro.
+    """
+    segment_texts = [
+        generate_segment_tts_text(idx + 1, segment)
+        for idx, segment in enumerate(video_def.segments)
+    ]
+    return [generate_intro_tts_text(video_def.title), *segment_texts, OUTRO_TEXT]
+
+
 def get_video_def_file_name(video_def: VideoDef):
     return video_def.title.replace(":", "_").replace(" ", "_")
 
 
+def load_video_def(file_path: str) -> VideoDef:
+    with open(file_path, "r") as f:
+        return jsonpickle.decode(f.read())
+
+
 def save_video_def(video_def: VideoDef, output_path: Union[str, None]):
     if output_path is None:
         output_path = f"{get_video_def_file_name(video_def)}.json"
@@ -122,3 +226,33 @@ def save_video_def(video_def: VideoDef, output_path: Union[str, None]):
 
     with open(output_path, "w") as file:
         file.write(json)
+
+
+def get_output_paths(
+    video_defs: List[VideoDef], output_path: Union[str, None], extension: str
+) -> List[str]:
+    """
+    Picks an output path for each video definition. If no output path is given, we use
+    the video titles. If there's more than one video and an output path is given, the
+    paths are numbered, e.g. out_1.json, out_2.json.
+    """
+    paths = []
+    for idx, video_def in enumerate(video_defs):
+        if output_path is None:
+            paths.append(f"{get_video_def_file_name(video_def)}{extension}")
+        elif len(video_defs) > 1:
+            root, ext = os.path.splitext(output_path)
+            paths.append(f"{root}_{idx + 1}{ext}")
+        else:
+            paths.append(output_path)
+    return paths
+
+
+def save_video_defs(video_defs: List[VideoDef], output_path: Union[str, None]):
+    """
+    Saves each video definition to its own file.
+    """
+    for video_def, path in zip(
+        video_defs, get_output_paths(video_defs, output_path, ".json")
+    ):
+        save_video_def(video_def, path)
@@ -1,62 +1,219 @@
+from typing import List
 import argparse
 import os
 
-import vid_def
-import render
-import wiki_api
+# Only lightweight modules are imported here. Each subcommand imports what it needs,
+# so that e.g. vid-def and --help never pay for importing moviepy, numpy, and PIL.
+import defaults
+import output_spec
+import tts
 
 
-def subcommand_build_video_def(args):
+def positive_int(value: str) -> int:
+    """
+    An argparse type for arguments that must be at least 1.
+    """
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"{value} must be at least 1.")
+    return n
+
+
+def output_spec_argument(value: str) -> output_spec.OutputSpec:
+    """
+    An argparse type for --output, so that malformed specs are reported before
+    we start building anything.
+    """
+    try:
+        return output_spec.parse_output_spec(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def select_list_url(args) -> str:
+    """
+    Returns the list article URL given on the command line, or picks a random one.
+    If an index was given, we pick only from lists that qualify.
+    """
     if args.url is not None:
-        url = args.url
-    else:
+        return args.url
+
+    import wiki_api
+
+    title = None
+    if args.index is not None:
+        import list_index
+
+        index = list_index.ListIndex(args.index)
+        title = index.random_qualifying_title()
+        index.close()
+        if title is None:
+            print("No qualifying lists in the index. Selecting any list article...")
+
+    if title is None:
         title = wiki_api.get_random_list_article()
-        url = wiki_api.get_url_from_article_title(title)
-        print(f"Selected article {title} ({url}).")
-    video_def = vid_def.video_def_from_list_url(url)
-    vid_def.save_video_def(video_def, args.out)
+
+    url = wiki_api.get_url_from_article_title(title)
+    print(f"Selected article {title} ({url}).")
+    return url
+
+
+def subcommand_build_video_def(args):
+    import vid_def
+
+    url = select_list_url(args)
+    video_defs = vid_def.video_defs_from_list_url(url, args.count)
+    if len(video_defs) < args.count:
+        print(f"The list only had enough items for {len(video_defs)} video(s).")
+
+    if args.bundle:
+        import bundle
+
+        tts_backend = tts.get_backend(args.tts)
+        paths = vid_def.get_output_paths(video_defs, args.out, "")
+        for video_def, path in zip(video_defs, paths):
+            bundle.write_bundle(video_def, path, tts_backend)
+            print(f"Bundle saved to {path}")
+    else:
+        vid_def.save_video_defs(video_defs, args.out)
 
 
 def get_default_output_path(input_path: str):
     return os.path.splitext(input_path)[0] + ".mp4"
 
 
+def get_output_specs(args, video_def) -> List[output_spec.OutputSpec]:
+    """
+    Returns the outputs to encode: one for every --output, plus --out (or a path based
+    on the video title) at full size, if it was given or there were no --outputs.
+    """
+    import vid_def
+
+    outputs = list(args.output)
+    if args.out is not None or len(outputs) == 0:
+        if args.out is None:
+            args.out = f"{vid_def.get_video_def_file_name(video_def)}.mp4"
+        outputs.insert(0, output_spec.OutputSpec(path=args.out))
+    return outputs
+
+
 def subcommand_render_video(args):
-    video_def = render.load_video_def_from_file(args.file)
-    clip = render.render_video_def(video_def)
-    if args.out is None:
-        args.out = f"{vid_def.get_video_def_file_name(video_def)}.mp4"
-    render.save_file(args.out, clip)
-    print(f"Video saved to {args.out}")
+    import render
+
+    video_def, video_bundle = render.load_render_input(args.file)
+    # bundles already have their narration, so don't start up a TTS engine for them
+    tts_backend = tts.get_backend(args.tts) if video_bundle is None else None
+    clip = render.render_video_def(video_def, tts_backend, video_bundle)
+    outputs = get_output_specs(args, video_def)
+    render.save_files(outputs, clip)
+    for output in outputs:
+        print(f"Video saved to {output.path}")
     print(f"Video title:\n {video_def.title}\n")
     print(f"Video description:\n {video_def.description}\n")
 
 
 def subcommand_full(args):
-    if args.url is not None:
-        url = args.url
-    else:
-        title = wiki_api.get_random_list_article()
-        url = wiki_api.get_url_from_article_title(title)
-        print(f"Selected article {title} ({url}).")
-    video_def = vid_def.video_def_from_list_url(url)
-    if len(video_def.segments) == 0:
+    import list_index
+    import pipeline
+    import render
+
+    url = select_list_url(args)
+
+    fill_thread = None
+    if args.index is not None and args.index_fill > 0:
+        # score a few more lists while we're busy building this video
+        fill_thread = list_index.fill_index_in_background(args.index, args.index_fill)
+
+    # builds the video definition and renders it at the same time
+    video_def, clip = pipeline.build_and_render(url, tts.get_backend(args.tts))
+    if clip is None:
         print("Found zero video segments for URL. Exiting...")
+        if fill_thread is not None:
+            fill_thread.join()
         return
 
-    clip = render.render_video_def(video_def)
-    if args.out is None:
-        args.out = f"{vid_def.get_video_def_file_name(video_def)}.mp4"
-    render.save_file(args.out, clip)
+    render.save_files(get_output_specs(args, video_def), clip)
     print("Description:\n")
     print(video_def.description)
 
+    if fill_thread is not None:
+        fill_thread.join()
+
+
+def subcommand_index_lists(args):
+    import list_index
+
+    index = list_index.ListIndex(args.index)
+    if args.refresh_catalog or index.n_lists() == 0:
+        list_index.refresh_catalog(index)
+
+    def progress(score: "list_index.ListScore"):
+        status = "qualifies" if score.qualifies() else "does not qualify"
+        print(
+            f"{score.title}: {score.n_eligible_items} items, {score.image_fraction:.0%} with images ({status})"
+        )
+
+    list_index.fill_index(index, args.limit, args.workers, progress)
+    print(
+        f"{index.n_qualifying()} of {index.n_lists()} list articles in the index qualify."
+    )
+    index.close()
+
+
+def subcommand_worker(args):
+    import worker
+
+    queue = worker.open_queue(args.queue)
+    worker.run_worker(
+        queue,
+        args.jobs,
+        tts.get_backend(args.tts),
+        args.poll_interval,
+        args.exit_when_empty,
+        args.http_stats,
+    )
+
+
+def add_tts_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--tts",
+        type=str,
+        choices=tts.BACKENDS.keys(),
+        default=None,
+        help="The TTS backend to use for narration. If not specified, uses the WATCHUGO_TTS_BACKEND environment variable, or Google TTS.",
+    )
+
+
+def add_output_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--output",
+        type=output_spec_argument,
+        action="append",
+        default=[],
+        help="An additional output, as [WIDTHxHEIGHT]:[BITRATE]:PATH (e.g. 1280x720:4000k:out_720.mp4). Can be given more than once. Every output is encoded from the same composited frames.",
+    )
+
+
+def add_index_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--index",
+        type=str,
+        default=None,
+        help="The path of a list qualification index (see index-lists). If specified, random articles are only selected from lists that qualify.",
+    )
+
 
 def setup_argparser():
     parser = argparse.ArgumentParser(
         description="Create a WatchUGO video from a Wikipedia list article."
     )
 
+    parser.add_argument(
+        "--http-stats",
+        action="store_true",
+        help="Print HTTP connection pool metrics when the command finishes (or after every job, for worker).",
+    )
+
     subparsers = parser.add_subparsers(required=True, dest="command")
     video_def_parser = subparsers.add_parser(
         "vid-def",
@@ -73,8 +230,21 @@ def setup_argparser():
         "--out",
         type=str,
         default=None,
-        help="The output path for the video definition file(s).",
+        help="The output path for the video definition file(s). If more than one video is built, the files are numbered.",
     )
+    video_def_parser.add_argument(
+        "--count",
+        type=positive_int,
+        default=1,
+        help="The number of videos to build from the list article. Videos never share items.",
+    )
+    add_index_argument(video_def_parser)
+    video_def_parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Output an asset bundle directory instead, with images and narration included, so the video can be rendered without network access.",
+    )
+    add_tts_argument(video_def_parser)
     video_def_parser.set_defaults(command=subcommand_build_video_def)
 
     render_vid_parser = subparsers.add_parser(
@@ -83,7 +253,9 @@ def setup_argparser():
         description="Render a video from a video definition file.",
     )
     render_vid_parser.add_argument(
-        "file", type=str, help="The location of the video definition file."
+        "file",
+        type=str,
+        help="The location of the video definition file, or asset bundle directory.",
     )
     render_vid_parser.add_argument(
         "--out",
@@ -91,6 +263,8 @@ def setup_argparser():
         default=None,
         help="The output path for the video file.",
     )
+    add_tts_argument(render_vid_parser)
+    add_output_argument(render_vid_parser)
     render_vid_parser.set_defaults(command=subcommand_render_video)
 
     full_parser = subparsers.add_parser(
@@ -111,6 +285,75 @@ def setup_argparser():
         default=None,
         help="The output path for the video.",
     )
+    add_tts_argument(full_parser)
+    add_output_argument(full_parser)
+    add_index_argument(full_parser)
+    full_parser.add_argument(
+        "--index-fill",
+        type=int,
+        default=0,
+        help="The number of unscored lists to score into the index in the background while this video is built.",
+    )
+
+    index_parser = subparsers.add_parser(
+        "index-lists",
+        help="Score list articles into a qualification index used for random article selection.",
+        description="Score list articles into a qualification index used for random article selection.",
+    )
+    index_parser.set_defaults(command=subcommand_index_lists)
+    index_parser.add_argument(
+        "--index",
+        type=str,
+        default=defaults.DEFAULT_INDEX_PATH,
+        help="The path of the index file. Defaults to %(default)s.",
+    )
+    index_parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="The maximum number of lists to score. If not specified, every unscored list is scored.",
+    )
+    index_parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=defaults.DEFAULT_FILL_WORKERS,
+        help="The number of lists to score concurrently. Defaults to %(default)s.",
+    )
+    index_parser.add_argument(
+        "--refresh-catalog",
+        action="store_true",
+        help="Re-fetch the catalog of list articles before scoring.",
+    )
+
+    worker_parser = subparsers.add_parser(
+        "worker",
+        help="Render video definition files from a job queue, keeping caches warm between jobs.",
+        description="Render video definition files from a job queue, keeping caches warm between jobs.",
+    )
+    worker_parser.set_defaults(command=subcommand_worker)
+    worker_parser.add_argument(
+        "queue",
+        type=str,
+        help="The job queue. Either a directory of video definition files and asset bundles, or a SQLite database with a jobs table.",
+    )
+    worker_parser.add_argument(
+        "--jobs",
+        type=positive_int,
+        default=1,
+        help="The number of jobs to run concurrently. Jobs run on threads, so extra jobs mainly overlap network and ffmpeg time.",
+    )
+    worker_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=defaults.DEFAULT_POLL_INTERVAL_SECS,
+        help="How often to check the queue for new jobs, in seconds. Defaults to %(default)s.",
+    )
+    worker_parser.add_argument(
+        "--exit-when-empty",
+        action="store_true",
+        help="Exit once the queue is empty, instead of waiting for new jobs.",
+    )
+    add_tts_argument(worker_parser)
 
     return parser
 
@@ -120,3 +363,8 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     args.command(args)
+
+    if args.http_stats:
+        import http_client
+
+        print(http_client.format_pool_metrics())
@@ -1,16 +1,39 @@
 from itertools import islice, takewhile, repeat
-from typing import List, Dict, Callable, Union
+from typing import List, Dict, Callable, Iterator, Tuple, Union
+import functools
 import random
+import threading
 import urllib.parse
 
 import mwapi
 
+import http_client
 
-USER_AGENT = "WatchUGOBot/1.0 (kevin.trieu5813@gmail.com)"
+USER_AGENT = http_client.USER_AGENT
 
-wikipedia_session = mwapi.Session("https://en.wikipedia.org", user_agent=USER_AGENT)
+# Sessions are created on first use, so that importing this module stays cheap.
+session_lock = threading.Lock()
 
-commons_session = mwapi.Session("https://commons.wikimedia.org/", user_agent=USER_AGENT)
+
+@functools.lru_cache(maxsize=None)
+def create_session(host: str) -> mwapi.Session:
+    # every API session shares the pooled HTTP session
+    return mwapi.Session(
+        host,
+        user_agent=USER_AGENT,
+        timeout=http_client.TIMEOUT_SECS,
+        session=http_client.get_session(),
+    )
+
+
+def get_wikipedia_session() -> mwapi.Session:
+    with session_lock:
+        return create_session("https://en.wikipedia.org")
+
+
+def get_commons_session() -> mwapi.Session:
+    with session_lock:
+        return create_session("https://commons.wikimedia.org/")
 
 
 def split_every(n, iterable):
@@ -24,36 +47,32 @@ def split_every(n, iterable):
     return takewhile(bool, (list(islice(iterator, n)) for _ in repeat(None)))
 
 
-def get_article_wikitext(article_title: str) -> str:
-    response = wikipedia_session.get(
-        action="parse",
-        page=article_title,
-        prop="wikitext",
-        formatversion="2",
-        redirects=True,
-    )
+def get_article_wikitext(
+    article_title: str, revision_id: Union[int, None] = None
+) -> str:
+    """
+    Returns the wikitext of an article. If revision_id is given, we return the wikitext
+    of that revision instead of the latest one.
+    """
+    if revision_id is not None:
+        response = get_wikipedia_session().get(
+            action="parse", oldid=revision_id, prop="wikitext", formatversion="2"
+        )
+    else:
+        response = get_wikipedia_session().get(
+            action="parse",
+            page=article_title,
+            prop="wikitext",
+            formatversion="2",
+            redirects=True,
+        )
     return response["parse"]["wikitext"]
 
 
-def get_article_image_url(article_title: str) -> str:
-    response = wikipedia_session.get(
-        action="query",
-        titles=article_title,
-        prop="pageimages",
-        piprop="original",
-        pilicense="any",
-        redirects=True,
-    )
-    pages = response["query"]["pages"]
-    # Wikipedia returns a dictionary of pages.
-    # Since we only ever query one, we can just grab the first one.
-    page = list(pages.items())[0][1]
-    if "original" in page:
-        url = page["original"]["source"]
-        if not url.lower().endswith("svg"):
-            return url
-
-    return None
+# Originals on Commons can be hundreds of megabytes, but images are shown at most
+# 1920 pixels wide in the video, so we ask for thumbnails that size instead.
+# (1920 is one of the standard Wikimedia thumbnail sizes.)
+IMAGE_THUMBNAIL_SIZE = 1920
 
 
 def commons_search_image(search: str) -> Union[str, None]:
@@ -63,7 +82,7 @@ def commons_search_image(search: str) -> Union[str, None]:
     """
     # Wikimedia Commons lets us specify a file type to filter by raster images only
     search_query = search + " filetype:jpg|png"
-    response = commons_session.get(
+    response = get_commons_session().get(
         action="query", list="search", srsearch=search_query, srnamespace="6"
     )
 
@@ -89,37 +108,25 @@ def get_fallback_article_image_url(article_title: str) -> Union[str, None]:
     if fallback_image_title is None:
         return None
 
-    response = commons_session.get(
-        action="query", prop="imageinfo", titles=fallback_image_title, iiprop="url"
+    response = get_commons_session().get(
+        action="query",
+        prop="imageinfo",
+        titles=fallback_image_title,
+        iiprop="url",
+        iiurlwidth=IMAGE_THUMBNAIL_SIZE,
     )
     pages = response["query"]["pages"]
     # Wikipedia returns a dictionary of pages.
     # Since we only ever query one, we can just grab the first one.
     page = list(pages.items())[0][1]
+    image_info = page["imageinfo"][0]
 
-    return page["imageinfo"][0]["url"]
+    return image_info.get("thumburl", image_info["url"])
 
 
 EXTRACTS_MAX_CHARS = 500
 
 
-def get_article_extract(article_title: str) -> str:
-    response = wikipedia_session.get(
-        action="query",
-        prop="extracts",
-        exchars=EXTRACTS_MAX_CHARS,
-        explaintext=True,
-        exintro=True,
-        titles=article_title,
-        redirects=True,
-    )
-    pages = response["query"]["pages"]
-    # Wikipedia returns a dictionary of pages.
-    # Since we only ever query one, we can just grab the first one.
-    page = list(pages.items())[0][1]
-    return page["extract"]
-
-
 MAX_TITLES_PER_QUERY = 50
 
 
@@ -137,7 +144,7 @@ def get_articles_exists(article_titles: List[str]) -> Dict[str, bool]:
 
     for chunk in title_chunks:
         joined_titles = "|".join(chunk)
-        responses = wikipedia_session.get(
+        responses = get_wikipedia_session().get(
             action="query", prop="info", titles=joined_titles, continuation=True
         )
 
@@ -156,6 +163,173 @@ def get_articles_exists(article_titles: List[str]) -> Dict[str, bool]:
     return result
 
 
+def get_denormalize_map(query: dict) -> Dict[str, str]:
+    """
+    Wikipedia normalizes, and optionally follows redirects for, any titles we give it.
+    Returns a dictionary mapping the titles in a query response back to the titles we asked for.
+    """
+    denormalize = {}
+    for entry in query.get("normalized", []):
+        denormalize[entry["to"]] = entry["from"]
+    for entry in query.get("redirects", []):
+        denormalize[entry["to"]] = denormalize.get(entry["from"], entry["from"])
+    return denormalize
+
+
+def query_pages_in_bulk(
+    article_titles: List[str], chunk_size: int, **params
+) -> Iterator[Tuple[str, dict]]:
+    """
+    Runs a prop query for article_titles, chunk_size titles at a time, following continuations.
+    Yields (lowercased title we asked for, page) pairs. A page can be yielded more than once
+    if its properties are split across continuations.
+    """
+    for chunk in split_every(chunk_size, article_titles):
+        responses = get_wikipedia_session().get(
+            action="query", titles="|".join(chunk), continuation=True, **params
+        )
+
+        for r in responses:
+            denormalize = get_denormalize_map(r["query"])
+            for _, page in r["query"]["pages"].items():
+                denormalized_title = denormalize.get(page["title"], page["title"])
+                yield denormalized_title.lower(), page
+
+
+def get_article_image_urls(article_titles: List[str]) -> Dict[str, Union[str, None]]:
+    """
+    Returns the page image URL of each article (or None, if there's no usable image),
+    keyed by lowercased article titles. The URLs are of thumbnails at most
+    IMAGE_THUMBNAIL_SIZE pixels wide or tall, not of the originals.
+    """
+    result = {}
+
+    for title, page in query_pages_in_bulk(
+        article_titles,
+        MAX_TITLES_PER_QUERY,
+        prop="pageimages",
+        piprop="original|thumbnail",
+        pithumbsize=IMAGE_THUMBNAIL_SIZE,
+        pilicense="any",
+        pilimit=MAX_TITLES_PER_QUERY,
+        redirects=True,
+    ):
+        # SVG thumbnails are rendered to PNG, so check the original for SVGs
+        original_url = page.get("original", {}).get("source", None)
+        url = page.get("thumbnail", {}).get("source", original_url)
+        if url is not None and not (original_url or url).lower().endswith("svg"):
+            result[title] = url
+        else:
+            # continuations can return the same page twice, so don't overwrite a hit
+            result.setdefault(title, None)
+
+    return result
+
+
+def get_latest_revision_ids(article_titles: List[str]) -> Dict[str, int]:
+    """
+    Returns the ID of the latest revision of each article, keyed by lowercased article titles.
+    Redirects are followed, and titles of pages that don't exist are left out.
+    This only fetches revision metadata, so it's much cheaper than fetching wikitext.
+    """
+    result = {}
+
+    for title, page in query_pages_in_bulk(
+        article_titles,
+        MAX_TITLES_PER_QUERY,
+        prop="revisions",
+        rvprop="ids",
+        redirects=True,
+    ):
+        if "revisions" in page:
+            result[title] = page["revisions"][0]["revid"]
+
+    return result
+
+
+def get_articles_have_images(article_titles: List[str]) -> Dict[str, bool]:
+    """
+    Determine whether each of the given articles has a usable (non-SVG) page image.
+    Returns a dictionary of booleans, keyed by lowercased article titles.
+    """
+    image_urls = get_article_image_urls(article_titles)
+    return {title: url is not None for title, url in image_urls.items()}
+
+
+# TextExtracts only returns this many intro extracts per query
+MAX_EXTRACTS_PER_QUERY = 20
+
+
+def get_article_extracts(article_titles: List[str]) -> Dict[str, str]:
+    """
+    Returns the plain text intro extract of each article, keyed by lowercased article titles.
+    """
+    result = {}
+
+    for title, page in query_pages_in_bulk(
+        article_titles,
+        MAX_EXTRACTS_PER_QUERY,
+        prop="extracts",
+        exchars=EXTRACTS_MAX_CHARS,
+        explaintext=True,
+        exintro=True,
+        exlimit=MAX_EXTRACTS_PER_QUERY,
+        redirects=True,
+    ):
+        if "extract" in page:
+            result[title] = page["extract"]
+
+    return result
+
+
+def get_urls_from_article_titles(article_titles: List[str]) -> Dict[str, str]:
+    """
+    Bulk version of get_url_from_article_title.
+    Returns a dictionary of article URLs, keyed by lowercased article titles.
+    Titles of pages that don't exist are left out.
+    """
+    result = {}
+
+    for title, page in query_pages_in_bulk(
+        article_titles, MAX_TITLES_PER_QUERY, prop="info", inprop="url"
+    ):
+        url = page.get("fullurl", None)
+        if url is not None:
+            result[title] = urllib.parse.unquote(url)
+
+    return result
+
+
+def iterate_list_articles(
+    progress_lambda: Callable[[int], None] = None,
+) -> Iterator[str]:
+    """
+    Iterate over the titles of every "List of" article, in alphabetical order.
+
+    Since this is a long-running operation, a progress_lambda can be passed in that will be called
+    before every request with the number of articles seen.
+    """
+    n_articles_seen = 0
+    r = get_wikipedia_session().get(
+        action="query", list="allpages", aplimit=500, apprefix="List of"
+    )
+    while True:
+        for p in r["query"]["allpages"]:
+            yield p["title"]
+            n_articles_seen += 1
+        if r.get("continue", None) is None:
+            return
+        if progress_lambda:
+            progress_lambda(n_articles_seen)
+        r = get_wikipedia_session().get(
+            action="query",
+            list="allpages",
+            aplimit=500,
+            apprefix="List of",
+            apcontinue=r["continue"]["apcontinue"],
+        )
+
+
 # This is an overestimate to avoid skipping pages
 N_LIST_OF_ARTICLES = 260000
 
@@ -171,32 +345,19 @@ def get_random_list_article(progress_lambda: Callable[[int], None] = None) -> st
     article_idx = random.randint(0, N_LIST_OF_ARTICLES)
     print(f"Selected random article number {article_idx}.")
 
-    n_articles_seen = 0
-    r = wikipedia_session.get(
-        action="query", list="allpages", aplimit=500, apprefix="List of"
-    )
-    while True:
-        for p in r["query"]["allpages"]:
-            if n_articles_seen == article_idx:
-                return p["title"]
-            n_articles_seen += 1
-        if r.get("continue", None) is None:
-            # we've reached the end, just return the last one
-            return r["query"]["allpages"][-1]["title"]
-        else:
-            if progress_lambda:
-                progress_lambda(n_articles_seen)
-            r = wikipedia_session.get(
-                action="query",
-                list="allpages",
-                aplimit=500,
-                apprefix="List of",
-                apcontinue=r["continue"]["apcontinue"],
-            )
+    title = None
+    for n_articles_seen, title in enumerate(iterate_list_articles(progress_lambda)):
+        if n_articles_seen == article_idx:
+            return title
+
+    # we've reached the end, just return the last one
+    return title
 
 
 def get_url_from_article_title(title):
-    r = wikipedia_session.get(action="query", prop="info", inprop="url", titles=title)
+    r = get_wikipedia_session().get(
+        action="query", prop="info", inprop="url", titles=title
+    )
 
     normalized = r["query"].get("normalized", None)
     if normalized:
@@ -1,6 +1,10 @@
-from urllib.parse import urlparse
-from dataclasses import dataclass
-from typing import List, Tuple, Union
+from urllib.parse import unquote, urlparse
+from dataclasses import dataclass, asdict
+from typing import Iterator, List, Tuple, Union
+import hashlib
+import json
+import os
+import threading
 
 import vid_def
 import wiki_api
@@ -95,17 +99,20 @@ ACCEPTABLE_LINK_FRACTION = 0.1
 
 
 def parse_column(
-    table: wtp.Table, column_idx: int, n_rows: int
+    cells: List[List], column_idx: int, n_rows: int
 ) -> Tuple[List[wtp.WikiLink], bool]:
     """
-    Parse a column of a WikiText table. For performance, we return both a list of wikilinks
-    and a boolean indicating eligibility.
+    Parse a column of a WikiText table, given the table's cells. For performance, we return
+    both a list of wikilinks and a boolean indicating eligibility.
     """
     unique_links = dict()
     n_links = 0
 
     for row in range(n_rows):
-        cell = table.cells(row, column_idx)
+        # rows can be ragged in malformed tables
+        if column_idx >= len(cells[row]):
+            continue
+        cell = cells[row][column_idx]
         # skip cells without links
         if cell is None or len(cell.wikilinks) == 0:
             continue
@@ -145,14 +152,17 @@ def extract_table(table: wtp.Table) -> List[VideoItem]:
 
     video_items = []
 
-    n_rows = len(table.data())
+    # Both of these re-parse the whole table on every call, so we only call them once.
+    data = table.data()
+    n_rows = len(data)
     if n_rows == 0:
         # this table is messed up, skip it
         return []
 
-    n_columns = len(table.data()[0])
+    cells = table.cells()
+    n_columns = len(data[0])
     for i in range(n_columns):
-        links, eligible = parse_column(table, i, n_rows)
+        links, eligible = parse_column(cells, i, n_rows)
         if eligible:
             video_items.extend(map(video_item_from_wikilink, links))
             break
@@ -177,17 +187,124 @@ SECTION_BLACKLIST = ["See also", "Notes", "References"]
 
 
 def extract_video_items(parsed: wtp.WikiText) -> List[VideoItem]:
+    """
+    Extracts VideoItems from every section of an article, except blacklisted ones.
+
+    Sections are visited without their subsections, so every list and table is
+    extracted exactly once. Subsections of a blacklisted section are skipped too.
+    """
     video_items = []
+    # the level of the blacklisted section we're inside, if any
+    blacklisted_level = None
+
+    for s in parsed.get_sections(include_subsections=False):
+        if blacklisted_level is not None:
+            if s.level > blacklisted_level:
+                continue
+            blacklisted_level = None
 
-    for s in parsed.get_sections(include_subsections=True):
         # skip the See Also section, which can contain lists
         if s.title is not None and s.title.strip() in SECTION_BLACKLIST:
+            blacklisted_level = s.level
             continue
         video_items.extend(extract_section(s))
 
     return video_items
 
 
+# Extracted items are cached on disk, keyed by the revision they were extracted from.
+CACHE_DIR = os.environ.get("WATCHUGO_CACHE_DIR", ".watchugo_cache")
+# Bump this whenever extract_video_items changes what it extracts, so that cached
+# items from the old heuristics are thrown away.
+EXTRACTION_VERSION = 1
+
+
+def normalize_article_title(title: str) -> str:
+    """
+    Normalizes an article title the way Wikipedia does, so that the same page always
+    has the same title: e.g. "list_of_things" (from a URL) and "List of things"
+    (from the catalog) both become "List of things". Only the first letter is
+    case-insensitive, since the rest of a title is case-sensitive.
+    """
+    title = " ".join(unescape_article_title(unquote(title)).split())
+    return title[:1].upper() + title[1:]
+
+
+def get_cache_path(article_title: str) -> str:
+    # titles can contain characters that aren't valid in file names, so hash them
+    title = normalize_article_title(article_title)
+    key = hashlib.sha1(title.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, "items", f"{key}.json")
+
+
+def load_cached_video_items(
+    article_title: str, revision_id: int
+) -> Union[List[VideoItem], None]:
+    """
+    Returns the cached items for article_title, or None if they weren't cached,
+    or were extracted from a different revision or by a different EXTRACTION_VERSION.
+    """
+    try:
+        with open(get_cache_path(article_title), "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if entry.get("extraction_version") != EXTRACTION_VERSION:
+        return None
+    if entry["revision_id"] != revision_id:
+        return None
+
+    return [VideoItem(**item) for item in entry["items"]]
+
+
+def store_cached_video_items(
+    article_title: str, revision_id: int, video_items: List[VideoItem]
+):
+    path = get_cache_path(article_title)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    entry = {
+        "article_title": article_title,
+        "revision_id": revision_id,
+        "extraction_version": EXTRACTION_VERSION,
+        "items": [asdict(item) for item in video_items],
+    }
+    # write to the side and rename, so concurrent readers never see half a file
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(temp_path, path)
+
+
+def get_article_video_items(
+    article_title: str, revision_id: Union[int, None] = None
+) -> List[VideoItem]:
+    """
+    Returns the video items in the list article named article_title. The extracted items
+    are cached, so we only download and parse the article if it changed since we last did.
+
+    If the latest revision ID is already known (e.g. from a bulk
+    wiki_api.get_latest_revision_ids query), it can be passed in to skip looking it up.
+    """
+    if revision_id is None:
+        revision_id = wiki_api.get_latest_revision_ids([article_title]).get(
+            article_title.lower(), None
+        )
+        if revision_id is None:
+            # the page doesn't exist, so let parse_article_wikitext report the error
+            return extract_video_items(parse_article_wikitext(article_title))
+
+    cached = load_cached_video_items(article_title, revision_id)
+    if cached is not None:
+        return cached
+
+    wikitext = wiki_api.get_article_wikitext(article_title, revision_id)
+    video_items = extract_video_items(wtp.parse(wikitext))
+    store_cached_video_items(article_title, revision_id, video_items)
+    return video_items
+
+
 MAX_CHARS = 250
 
 
@@ -213,23 +330,36 @@ def clean_extract(extract: str) -> str:
     return extract
 
 
-def segment_from_video_item(item: VideoItem) -> Union["vid_def.Segment", None]:
+def segments_from_video_items(
+    items: List[VideoItem],
+) -> Iterator[Union["vid_def.Segment", None]]:
     """
-    Builds a segment from the given video item.
+    Builds a segment from each of the given video items, fetching their metadata in bulk.
+    Yields each item's segment, or None if we couldn't build one, in the order of `items`.
+    Items without a page image need a fallback search, so each segment is yielded as soon
+    as its own search is done, rather than after every search in the batch.
     """
-    segment_desc = clean_extract(wiki_api.get_article_extract(item.article_title))
-
-    image_url = wiki_api.get_article_image_url(item.article_title)
-    if image_url is None:
-        image_url = wiki_api.get_fallback_article_image_url(item.article_title)
-
-    # We really didn't find anything, turf this item
-    if image_url is None:
-        return None
+    titles = [item.article_title for item in items]
+    extracts = wiki_api.get_article_extracts(titles)
+    image_urls = wiki_api.get_article_image_urls(titles)
+    article_urls = wiki_api.get_urls_from_article_titles(titles)
+
+    for item in items:
+        key = item.article_title.lower()
+
+        image_url = image_urls.get(key, None)
+        if image_url is None:
+            # the fallback is a search, so it can't be done in bulk
+            image_url = wiki_api.get_fallback_article_image_url(item.article_title)
+
+        # We really didn't find anything, turf this item
+        if image_url is None or key not in article_urls:
+            yield None
+            continue
 
-    return vid_def.Segment(
-        name=item.name,
-        description=segment_desc,
-        image_url=image_url,
-        article_url=wiki_api.get_url_from_article_title(item.article_title),
-    )
+        yield vid_def.Segment(
+            name=item.name,
+            description=clean_extract(extracts.get(key, "")),
+            image_url=image_url,
+            article_url=article_urls[key],
+        )
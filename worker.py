@@ -0,0 +1,341 @@
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, asdict
+from typing import Dict, Tuple, Union
+import glob
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+import bundle
+import defaults
+import http_client
+import render
+import temp
+import tts
+import vid_def
+
+"""
+A long-running worker that renders video definitions from a local job queue.
+Running many jobs in one process keeps HTTP sessions, decoded static images and
+cached narration warm, instead of paying for them on every invocation.
+
+A queue is either a directory of video definition JSON files and asset bundles, or a
+SQLite database with a `jobs` table.
+
+Jobs run on threads, so the CPU-bound compositing of concurrent jobs competes for the
+GIL. Running more than one job at once mainly overlaps network and ffmpeg time; to use
+more cores, run more worker processes on the same queue.
+"""
+
+# Workers refresh the claims on their running jobs every poll interval. A claim that
+# hasn't been refreshed for this long belongs to a worker that crashed or was killed,
+# so the job is put back in the queue.
+STALE_CLAIM_SECS = 10 * 60
+
+# Directory queue entries with these suffixes have been claimed
+CLAIMED_SUFFIXES = (".running", ".done", ".failed")
+
+
+@dataclass
+class Job:
+    # A queue-specific identifier for this job.
+    id: str
+    # The video definition file (or asset bundle directory) to render.
+    video_def_path: str
+    # Where to save the rendered video. If None, we pick a name based on the video title.
+    output_path: Union[str, None]
+
+
+@dataclass
+class JobRecord:
+    # Either "done" or "failed".
+    status: str
+    # The path the video was saved to, if it was saved.
+    output_path: Union[str, None]
+    # Wall clock timestamps for the job.
+    started_at: float
+    finished_at: float
+    # Seconds spent in each phase of the job, keyed by phase name.
+    timings: Dict[str, float]
+    # The traceback of the failure, if the job failed.
+    error: Union[str, None]
+    # The host and thread that ran the job.
+    worker: str
+
+
+class DirectoryQueue:
+    """
+    Every *.json file and asset bundle directory in the directory is a pending job.
+    A job is claimed by renaming it with a .running suffix, which is atomic, so multiple
+    workers can share a directory. When the job finishes, the .running suffix is replaced
+    with .done or .failed, and its JobRecord is written next to it as *.status.json.
+
+    The modification time of a .running file (or bundle) is its claim's heartbeat.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def is_pending(self, path: str) -> bool:
+        if path.endswith(".json"):
+            return not path.endswith(".status.json") and os.path.isfile(path)
+        return not path.endswith(CLAIMED_SUFFIXES) and bundle.is_bundle(path)
+
+    def get_job_root(self, path: str) -> str:
+        """
+        Returns the path of a job without its .json extension, which its output and
+        status files are named after. Bundle names can contain dots, so we can't
+        just use splitext.
+        """
+        if path.endswith(".json"):
+            return path[: -len(".json")]
+        return path
+
+    def requeue_stale(self):
+        stale_before = time.time() - STALE_CLAIM_SECS
+        for running_path in glob.glob(os.path.join(self.path, "*.running")):
+            try:
+                if os.path.getmtime(running_path) < stale_before:
+                    os.rename(running_path, running_path[: -len(".running")])
+            except OSError:
+                # it finished, or another worker requeued it first
+                continue
+
+    def claim(self) -> Union[Job, None]:
+        self.requeue_stale()
+
+        for path in sorted(glob.glob(os.path.join(self.path, "*"))):
+            if not self.is_pending(path):
+                continue
+
+            running_path = path + ".running"
+            try:
+                # renaming keeps the old modification time, so refresh it first,
+                # or the claim would look stale straight away
+                os.utime(path)
+                os.rename(path, running_path)
+            except OSError:
+                # another worker got here first
+                continue
+
+            return Job(
+                id=path,
+                video_def_path=running_path,
+                output_path=self.get_job_root(path) + ".mp4",
+            )
+
+        return None
+
+    def heartbeat(self, job: Job):
+        try:
+            os.utime(job.video_def_path)
+        except OSError:
+            pass
+
+    def complete(self, job: Job, record: JobRecord):
+        os.rename(job.video_def_path, f"{job.id}.{record.status}")
+        with open(self.get_job_root(job.id) + ".status.json", "w") as f:
+            json.dump(asdict(record), f, indent=True)
+
+
+class SQLiteQueue:
+    """
+    Jobs are rows in a `jobs` table. Insert a row with a video_def_path (and optionally
+    an output_path) to queue a job. The worker fills in the status, timing, and error columns.
+    Running jobs have their heartbeat_at column refreshed, so stale claims can be found.
+    """
+
+    def __init__(self, path: str):
+        # We claim and complete jobs from the main worker thread only.
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_def_path TEXT NOT NULL,
+                output_path TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                started_at REAL,
+                finished_at REAL,
+                timings TEXT,
+                error TEXT,
+                worker TEXT,
+                heartbeat_at REAL
+            )
+            """
+        )
+        # queues made before heartbeats were added don't have the column yet
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(jobs)")]
+        if "heartbeat_at" not in columns:
+            self.connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    def add(self, video_def_path: str, output_path: Union[str, None] = None):
+        self.connection.execute(
+            "INSERT INTO jobs (video_def_path, output_path) VALUES (?, ?)",
+            (video_def_path, output_path),
+        )
+
+    def claim(self) -> Union[Job, None]:
+        # take a write lock up front, so two workers can't claim the same row
+        self.connection.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        self.connection.execute(
+            "UPDATE jobs SET status = 'pending' WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?",
+            (now - STALE_CLAIM_SECS,),
+        )
+        row = self.connection.execute(
+            "SELECT id, video_def_path, output_path FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            self.connection.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (now, now, row[0]),
+            )
+        self.connection.execute("COMMIT")
+
+        if row is None:
+            return None
+        return Job(id=str(row[0]), video_def_path=row[1], output_path=row[2])
+
+    def heartbeat(self, job: Job):
+        self.connection.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+            (time.time(), int(job.id)),
+        )
+
+    def complete(self, job: Job, record: JobRecord):
+        self.connection.execute(
+            """
+            UPDATE jobs SET status = ?, output_path = ?, started_at = ?, finished_at = ?,
+                timings = ?, error = ?, worker = ?
+            WHERE id = ?
+            """,
+            (
+                record.status,
+                record.output_path,
+                record.started_at,
+                record.finished_at,
+                json.dumps(record.timings),
+                record.error,
+                record.worker,
+                int(job.id),
+            ),
+        )
+
+
+def open_queue(path: str) -> Union[DirectoryQueue, SQLiteQueue]:
+    """
+    Opens the queue at `path`: a directory queue if `path` is a directory,
+    otherwise a SQLite queue.
+    """
+    if os.path.isdir(path):
+        return DirectoryQueue(path)
+    else:
+        return SQLiteQueue(path)
+
+
+def run_job(
+    job: Job, tts_backend: tts.TTSBackend, temp_files: temp.TempFileScope
+) -> JobRecord:
+    """
+    Renders a single job. Never raises: failures are reported in the returned record.
+    Every temp file the job makes is recorded in `temp_files`.
+    """
+    started_at = time.time()
+    timings = {}
+    output_path = job.output_path
+    worker = f"{socket.gethostname()}/{threading.current_thread().name}"
+
+    try:
+        with temp_files:
+            phase_start = time.perf_counter()
+            video_def, video_bundle = render.load_render_input(job.video_def_path)
+            timings["load"] = time.perf_counter() - phase_start
+
+            phase_start = time.perf_counter()
+            clip = render.render_video_def(video_def, tts_backend, video_bundle)
+            timings["compose"] = time.perf_counter() - phase_start
+
+            if output_path is None:
+                output_path = f"{vid_def.get_video_def_file_name(video_def)}.mp4"
+
+            phase_start = time.perf_counter()
+            render.save_file(output_path, clip)
+            timings["encode"] = time.perf_counter() - phase_start
+    except Exception:
+        return JobRecord(
+            status="failed",
+            output_path=None,
+            started_at=started_at,
+            finished_at=time.time(),
+            timings=timings,
+            error=traceback.format_exc(),
+            worker=worker,
+        )
+
+    return JobRecord(
+        status="done",
+        output_path=output_path,
+        started_at=started_at,
+        finished_at=time.time(),
+        timings=timings,
+        error=None,
+        worker=worker,
+    )
+
+
+def run_worker(
+    queue: Union[DirectoryQueue, SQLiteQueue],
+    n_jobs: int,
+    tts_backend: tts.TTSBackend,
+    poll_interval: float = defaults.DEFAULT_POLL_INTERVAL_SECS,
+    exit_when_empty: bool = False,
+    report_http_stats: bool = False,
+):
+    """
+    Runs up to `n_jobs` jobs from `queue` at once, polling for new jobs every
+    `poll_interval` seconds. Runs forever, unless `exit_when_empty` is set, in which
+    case we return once the queue is drained. If `report_http_stats` is set, we print
+    connection pool metrics after every job.
+
+    Claims on running jobs are refreshed every `poll_interval` seconds, which must be
+    well under STALE_CLAIM_SECS. Each job's temp files are deleted once it's completed.
+    """
+    running: Dict[Future, Tuple[Job, temp.TempFileScope]] = {}
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        while True:
+            while len(running) < n_jobs:
+                job = queue.claim()
+                if job is None:
+                    break
+                print(f"Starting job {job.id} ({job.video_def_path}).")
+                temp_files = temp.TempFileScope()
+                future = executor.submit(run_job, job, tts_backend, temp_files)
+                running[future] = (job, temp_files)
+
+            if len(running) == 0:
+                if exit_when_empty:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, temp_files = running.pop(future)
+                record = future.result()
+                queue.complete(job, record)
+                temp_files.remove_all()
+                elapsed = record.finished_at - record.started_at
+                print(f"Job {job.id} {record.status} in {elapsed:.1f}s.")
+                if record.error is not None:
+                    print(record.error)
+                if report_http_stats:
+                    print(http_client.format_pool_metrics())
+
+            for job, _ in running.values():
+                queue.heartbeat(job)